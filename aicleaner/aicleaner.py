@@ -1,15 +1,32 @@
 import os
+import re
+import json
 import time
 import yaml
 import requests
-from google.generativeai.client import configure
-from google.generativeai.generative_models import GenerativeModel
 import logging
 from PIL import Image
 
 # Configure logging
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 
+# Only camera and api_key are strictly required for the script to function.
+# The others have defaults or are handled gracefully.
+REQUIRED_HA_KEYS = ("api_url", "token", "camera_entity_id")
+REQUIRED_GEMINI_KEYS = ("api_key",)
+
+# Matches the sensor_entity_id default in the add-on's config.yaml.
+DEFAULT_SENSOR_ENTITY_ID = "sensor.aicleaner_cleanliness_score"
+
+# Prefer the libyaml-backed loader when PyYAML was built with it.
+YAML_LOADER = getattr(yaml, "CSafeLoader", yaml.SafeLoader)
+
+# Captures the body of a markdown code fence (optionally tagged json) in a Gemini reply.
+JSON_FENCE_RE = re.compile(r"```(?:json)?\s*(.*?)\s*```", re.DOTALL)
+
+# Keys a Gemini analysis must contain to be usable.
+REQUIRED_RESPONSE_KEYS = frozenset(("score", "tasks"))
+
 class AICleaner:
     def __init__(self):
         """
@@ -25,8 +42,11 @@ class AICleaner:
             "Authorization": f"Bearer {self.ha_token}",
             "content-type": "application/json",
         }
+        # Every Home Assistant call goes through this session, so a cycle reuses one connection.
+        self.ha_session = requests.Session()
+        self.ha_session.headers.update(self.ha_headers)
         self.camera_entity_id = self.config['home_assistant']['camera_entity_id']
-        self.sensor_entity_id = self.config['home_assistant']['sensor_entity_id']
+        self.sensor_entity_id = self.config['home_assistant'].get('sensor_entity_id') or DEFAULT_SENSOR_ENTITY_ID
         # Handle the todolist entity, defaulting if not provided.
         self.todolist_entity_id = self._handle_todolist()
         
@@ -34,8 +54,11 @@ class AICleaner:
         gemini_api_key = self.config['google_gemini']['api_key']
         if not gemini_api_key:
             raise ValueError("Google Gemini API key is not configured.")
-        configure(api_key=gemini_api_key)
-        self.gemini_model = GenerativeModel('gemini-1.5-pro')
+        # Imported here rather than at module level: the SDK pulls in protobuf
+        # and gRPC, which config loading and the tests for it don't need.
+        import google.generativeai as genai
+        genai.configure(api_key=gemini_api_key)
+        self.gemini_model = genai.GenerativeModel('gemini-1.5-pro')
 
 
     def _load_config(self):
@@ -83,7 +106,7 @@ class AICleaner:
             config_path = 'config.yaml'
         
         with open(config_path, 'r') as f:
-            return yaml.safe_load(f)
+            return yaml.load(f, Loader=YAML_LOADER)
 
     def _validate_config(self):
         """
@@ -91,22 +114,17 @@ class AICleaner:
         Raises ValueError if a required key is missing.
         """
         logging.info("Validating configuration.")
-        # Only camera and api_key are strictly required for the script to function.
-        # The others have defaults or are handled gracefully.
-        required_ha_keys = ["api_url", "token", "camera_entity_id"]
-        required_gemini_keys = ["api_key"]
-        
         if "home_assistant" not in self.config:
             raise ValueError("Missing 'home_assistant' configuration block.")
         
-        for key in required_ha_keys:
+        for key in REQUIRED_HA_KEYS:
             if key not in self.config["home_assistant"] or not self.config["home_assistant"][key]:
                 raise ValueError(f"Missing required Home Assistant configuration key: '{key}'")
 
         if "google_gemini" not in self.config:
             raise ValueError("Missing 'google_gemini' configuration block.")
             
-        for key in required_gemini_keys:
+        for key in REQUIRED_GEMINI_KEYS:
             if key not in self.config["google_gemini"] or not self.config["google_gemini"][key]:
                 raise ValueError(f"Missing required Google Gemini configuration key: '{key}'")
         
@@ -145,7 +163,7 @@ class AICleaner:
         snapshot_path = "snapshot.jpg"
 
         try:
-            response = requests.get(snapshot_url, headers=self.ha_headers, timeout=10)
+            response = self.ha_session.get(snapshot_url, timeout=10)
             response.raise_for_status()  # Raise an exception for bad status codes
             
             with open(snapshot_path, 'wb') as f:
@@ -200,12 +218,23 @@ class AICleaner:
         Parses the JSON response from Gemini.
         """
         try:
-            # Clean up the response text to remove markdown code block fences
-            cleaned_text = response_text.strip().replace("```json", "").replace("```", "").strip()
-            data = yaml.safe_load(cleaned_text) # Use yaml loader for more robust JSON parsing
+            # Take the contents of the markdown code fence if there is one,
+            # which also drops any prose Gemini put around it. Otherwise strip
+            # any unpaired fence marker, e.g. a reply cut off before its closing fence.
+            fence = JSON_FENCE_RE.search(response_text)
+            if fence:
+                cleaned_text = fence.group(1)
+            else:
+                cleaned_text = response_text.replace("```json", "").replace("```", "").strip()
+            try:
+                data = json.loads(cleaned_text)
+            except json.JSONDecodeError:
+                # Fall back to the yaml loader, which tolerates the near-JSON
+                # (single quotes, trailing commas in flow style) Gemini sometimes returns.
+                data = yaml.load(cleaned_text, Loader=YAML_LOADER)
             
             # Basic validation
-            if "score" in data and "tasks" in data:
+            if isinstance(data, dict) and REQUIRED_RESPONSE_KEYS <= data.keys():
                 logging.info(f"Successfully parsed Gemini response. Score: {data['score']}")
                 return data
             else:
@@ -234,7 +263,7 @@ class AICleaner:
             }
         }
         try:
-            response = requests.post(url, headers=self.ha_headers, json=payload, timeout=10)
+            response = self.ha_session.post(url, json=payload, timeout=10)
             response.raise_for_status()
             logging.info(f"Successfully updated sensor {self.sensor_entity_id}")
         except requests.exceptions.RequestException as e:
@@ -250,14 +279,14 @@ class AICleaner:
 
         logging.info(f"Updating todolist {self.todolist_entity_id} with {len(tasks)} tasks.")
         url = f"{self.ha_url}/api/services/todo/add_item"
-        
+
         for task in tasks:
             payload = {
                 "entity_id": self.todolist_entity_id,
                 "item": task
             }
             try:
-                response = requests.post(url, headers=self.ha_headers, json=payload, timeout=10)
+                response = self.ha_session.post(url, json=payload, timeout=10)
                 response.raise_for_status()
                 logging.info(f"Successfully added task: '{task}'")
             except requests.exceptions.RequestException as e:
@@ -0,0 +1,76 @@
+import sys
+import pytest
+from types import MappingProxyType, SimpleNamespace
+from unittest.mock import patch, MagicMock
+from aicleaner import aicleaner
+
+@pytest.fixture(scope="session")
+def mock_config():
+    """
+    Pytest fixture for mock configuration data, shared across the session.
+    It is read-only, so no test can leak changes into the others.
+    """
+    return MappingProxyType({
+        'home_assistant': MappingProxyType({
+            'api_url': 'http://fake-ha.local:8123',
+            'token': 'fake-token',
+            'camera_entity_id': 'camera.fake_cam',
+            'todolist_entity_id': 'todo.fake_list',
+            'sensor_entity_id': 'sensor.fake_sensor'
+        }),
+        'google_gemini': MappingProxyType({
+            'api_key': 'fake-gemini-key'
+        }),
+        'application': MappingProxyType({
+            'analysis_interval_minutes': 30
+        })
+    })
+
+@pytest.fixture(scope="session")
+def yaml_content():
+    """Pytest fixture for the YAML document equivalent to mock_config."""
+    return """
+home_assistant:
+  api_url: http://fake-ha.local:8123
+  token: fake-token
+  camera_entity_id: camera.fake_cam
+  todolist_entity_id: todo.fake_list
+  sensor_entity_id: sensor.fake_sensor
+google_gemini:
+  api_key: fake-gemini-key
+application:
+  analysis_interval_minutes: 30
+"""
+
+@pytest.fixture(scope="session", autouse=True)
+def stub_gemini():
+    """
+    Stands in for the Gemini SDK for the whole session, so no test configures
+    or instantiates the real client, or pays for importing it.
+    """
+    genai = SimpleNamespace(
+        configure=lambda **kwargs: None,
+        GenerativeModel=lambda *args, **kwargs: MagicMock(),
+    )
+    with pytest.MonkeyPatch.context() as mp:
+        mp.setitem(sys.modules, 'google.generativeai', genai)
+        yield
+
+@pytest.fixture(scope="module")
+def module_cleaner(mock_config):
+    """
+    Builds a single AICleaner per test module, so the constructor runs once
+    rather than once per test.
+    """
+    with patch.object(aicleaner.AICleaner, '_load_config', return_value=mock_config):
+        return aicleaner.AICleaner()
+
+@pytest.fixture
+def cleaner_instance(module_cleaner, monkeypatch):
+    """
+    Pytest fixture for an initialized AICleaner instance.
+    The shared instance gets a fresh Gemini model mock for every test so call
+    history and side effects never leak between tests.
+    """
+    monkeypatch.setattr(module_cleaner, 'gemini_model', MagicMock())
+    return module_cleaner
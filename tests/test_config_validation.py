@@ -1,62 +1,85 @@
 import pytest
+from collections.abc import Mapping
+from types import MappingProxyType
 from unittest.mock import patch
 from aicleaner import aicleaner
-import copy
 
-@pytest.fixture
+@pytest.fixture(scope="module")
 def valid_config():
-    """A fixture for a complete and valid configuration."""
-    return {
-        'home_assistant': {
+    """
+    A fixture for a complete and valid configuration, built once per module.
+    It is read-only; use _without() to derive invalid variants.
+    """
+    return MappingProxyType({
+        'home_assistant': MappingProxyType({
             'api_url': 'http://fake-ha.local:8123',
             'token': 'fake-token',
             'camera_entity_id': 'camera.fake_cam',
             'todolist_entity_id': 'todo.fake_list',
             'sensor_entity_id': 'sensor.fake_sensor'
-        },
-        'google_gemini': {
+        }),
+        'google_gemini': MappingProxyType({
             'api_key': 'fake-gemini-key'
-        },
-        'application': {
+        }),
+        'application': MappingProxyType({
             'analysis_interval_minutes': 30
-        }
-    }
+        })
+    })
+
+def _without(cfg, block, key=None):
+    """
+    Returns a copy of cfg with a whole block, or a single key within a block,
+    removed. Only the dict levels are rebuilt: the values are immutable.
+    """
+    out = {k: dict(v) if isinstance(v, Mapping) else v for k, v in cfg.items()}
+    if key is None:
+        out.pop(block)
+    else:
+        out[block].pop(key)
+    return out
 
 def test_validation_success(valid_config):
     """Tests that a valid configuration passes validation."""
     with patch.object(aicleaner.AICleaner, '_load_config', return_value=valid_config):
-        with patch('google.generativeai.configure'), patch('google.generativeai.GenerativeModel'):
-            try:
-                aicleaner.AICleaner()
-            except ValueError:
-                pytest.fail("AICleaner initialization failed with a valid config.")
-
-@pytest.mark.parametrize("missing_key", [
-    "api_url", "token", "camera_entity_id", "todolist_entity_id", "sensor_entity_id"
-])
+        try:
+            aicleaner.AICleaner()
+        except ValueError:
+            pytest.fail("AICleaner initialization failed with a valid config.")
+
+@pytest.mark.parametrize("missing_key", ("api_url", "token", "camera_entity_id"))
 def test_missing_ha_key(valid_config, missing_key):
-    """Tests that a ValueError is raised if a Home Assistant key is missing."""
-    invalid_config = copy.deepcopy(valid_config)
-    del invalid_config['home_assistant'][missing_key]
+    """Tests that a ValueError is raised if a required Home Assistant key is missing."""
+    invalid_config = _without(valid_config, 'home_assistant', missing_key)
     
     with patch.object(aicleaner.AICleaner, '_load_config', return_value=invalid_config):
         with pytest.raises(ValueError, match=f"Missing required Home Assistant configuration key: '{missing_key}'"):
             aicleaner.AICleaner()
 
-def test_missing_gemini_key(valid_config):
-    """Tests that a ValueError is raised if the Gemini API key is missing."""
-    invalid_config = copy.deepcopy(valid_config)
-    del invalid_config['google_gemini']['api_key']
-    
+def test_missing_todolist_entity(valid_config):
+    """Tests that a ValueError explaining how to create a list is raised if no to-do list is configured."""
+    invalid_config = _without(valid_config, 'home_assistant', 'todolist_entity_id')
+
     with patch.object(aicleaner.AICleaner, '_load_config', return_value=invalid_config):
-        with pytest.raises(ValueError, match="Missing required Google Gemini configuration key: 'api_key'"):
+        with pytest.raises(ValueError, match="No to-do list entity ID was provided in the configuration."):
             aicleaner.AICleaner()
 
-def test_missing_ha_block(valid_config):
-    """Tests that a ValueError is raised if the entire Home Assistant block is missing."""
-    invalid_config = copy.deepcopy(valid_config)
-    del invalid_config['home_assistant']
+def test_missing_sensor_entity_uses_default(valid_config):
+    """Tests that the add-on's default sensor entity is used if none is configured."""
+    config = _without(valid_config, 'home_assistant', 'sensor_entity_id')
+
+    with patch.object(aicleaner.AICleaner, '_load_config', return_value=config):
+        cleaner = aicleaner.AICleaner()
+    assert cleaner.sensor_entity_id == "sensor.aicleaner_cleanliness_score"
+
+@pytest.mark.parametrize("block, key, message", [
+    ("google_gemini", "api_key", "Missing required Google Gemini configuration key: 'api_key'"),
+    ("home_assistant", None, "Missing 'home_assistant' configuration block."),
+    ("google_gemini", None, "Missing 'google_gemini' configuration block."),
+], ids=["gemini_api_key", "ha_block", "gemini_block"])
+def test_missing_required_entry(valid_config, block, key, message):
+    """Tests that a ValueError is raised if a required Gemini key or a whole block is missing."""
+    invalid_config = _without(valid_config, block, key)
     
     with patch.object(aicleaner.AICleaner, '_load_config', return_value=invalid_config):
-        with pytest.raises(ValueError, match="Missing 'home_assistant' configuration block."):
-            aicleaner.AICleaner()
\ No newline at end of file
+        with pytest.raises(ValueError, match=message):
+            aicleaner.AICleaner()
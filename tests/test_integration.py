@@ -1,35 +1,4 @@
-import pytest
-import os
-from unittest.mock import patch, MagicMock
-from aicleaner import aicleaner
-
-@pytest.fixture
-def mock_config():
-    """Pytest fixture for mock configuration data."""
-    return {
-        'home_assistant': {
-            'api_url': 'http://fake-ha.local:8123',
-            'token': 'fake-token',
-            'camera_entity_id': 'camera.fake_cam',
-            'todolist_entity_id': 'todo.fake_list',
-            'sensor_entity_id': 'sensor.fake_sensor'
-        },
-        'google_gemini': {
-            'api_key': 'fake-gemini-key'
-        },
-        'application': {
-            'analysis_interval_minutes': 30
-        }
-    }
-
-@pytest.fixture
-def cleaner_instance(mock_config):
-    """Pytest fixture for an initialized AICleaner instance for integration tests."""
-    with patch.object(aicleaner.AICleaner, '_load_config', return_value=mock_config):
-        with patch('google.generativeai.configure'):
-            with patch('google.generativeai.GenerativeModel'):
-                instance = aicleaner.AICleaner()
-    return instance
+from unittest.mock import patch
 
 def test_run_cycle_success(cleaner_instance):
     """
@@ -40,12 +9,9 @@ def test_run_cycle_success(cleaner_instance):
          patch.object(cleaner_instance, 'analyze_image_with_gemini', return_value={'score': 90, 'tasks': ['Do this', 'Do that']}) as mock_analyze, \
          patch.object(cleaner_instance, 'update_ha_sensor') as mock_update_sensor, \
          patch.object(cleaner_instance, 'update_ha_todolist') as mock_update_list, \
-         patch('os.remove') as mock_remove, \
-         patch('time.sleep', side_effect=InterruptedError):  # Use InterruptedError to break the loop
-
-        # Run the method, expecting it to break after one loop
-        with pytest.raises(InterruptedError):
-            cleaner_instance.run()
+         patch('os.remove') as mock_remove:
+        # run() performs a single cycle; the scheduling loop lives in run.sh
+        cleaner_instance.run()
 
         # Assert that each step in the orchestration was called correctly
         mock_snapshot.assert_called_once()
@@ -60,11 +26,8 @@ def test_run_cycle_snapshot_fails(cleaner_instance):
     """
     with patch.object(cleaner_instance, 'get_camera_snapshot', return_value=None) as mock_snapshot, \
          patch.object(cleaner_instance, 'analyze_image_with_gemini') as mock_analyze, \
-         patch('os.remove') as mock_remove, \
-         patch('time.sleep', side_effect=InterruptedError):
-
-        with pytest.raises(InterruptedError):
-            cleaner_instance.run()
+         patch('os.remove') as mock_remove:
+        cleaner_instance.run()
 
         mock_snapshot.assert_called_once()
         mock_analyze.assert_not_called()
@@ -78,11 +41,8 @@ def test_run_cycle_analysis_fails(cleaner_instance):
          patch.object(cleaner_instance, 'analyze_image_with_gemini', return_value=None) as mock_analyze, \
          patch.object(cleaner_instance, 'update_ha_sensor') as mock_update_sensor, \
          patch.object(cleaner_instance, 'update_ha_todolist') as mock_update_list, \
-         patch('os.remove') as mock_remove, \
-         patch('time.sleep', side_effect=InterruptedError):
-
-        with pytest.raises(InterruptedError):
-            cleaner_instance.run()
+         patch('os.remove') as mock_remove:
+        cleaner_instance.run()
 
         mock_snapshot.assert_called_once()
         mock_analyze.assert_called_once_with('fake_snapshot.jpg')